@@ -24,13 +24,21 @@ from subprocess import Popen, PIPE
 import shlex
 import socket
 import atexit
+import itertools
+import threading
+from collections import deque
+from queue import Queue
 
 from .communicator import Communicator
 from .wrappers import NamespaceWrapper, ReturnStringWrapper
 from .utils import join, stringify, list_get, list_range, list_size, to_list
+from .utils import to_dict
 
 class Interpreter:
     MAX_MSG_SIZE=16384
+    PIPELINE_WINDOW=256
+    PIPELINE_BYTES=32768
+    communicator_class=Communicator
 
     def __init__(self,
                  command="tclsh {script} {tcl_args}",
@@ -39,7 +47,11 @@ class Interpreter:
                  communication="auto",
                  port=None,
                  encrypt_data=True,
-                 args_passing="file"):
+                 args_passing="file",
+                 multiplex=False,
+                 framing="auto",
+                 cipher=None,
+                 buffer_size=None):
 
         self.command_list = []
         self.command = command
@@ -48,30 +60,130 @@ class Interpreter:
         self.communication = communication
         self.encrypt_data = encrypt_data
         self.args_passing = args_passing
+        self.framing = framing
+        self.cipher = cipher
+        self.buffer_size = buffer_size
         self.port = port
+        self.multiplex = multiplex
         self.registered_fun = []
-
-        self.communicator = Communicator(command,
-                                         env,
-                                         redirect_stdout,
-                                         communication,
-                                         port,
-                                         encrypt_data,
-                                         args_passing)
+        self.local = threading.local()
+        self.send_lock = threading.Lock()
+        self.waiters_lock = threading.Lock()
+        self.waiters = None
+        self.request_ids = itertools.count()
+        self.dispatcher = None
+
+        self.communicator = self.communicator_class(command,
+                                                    env,
+                                                    redirect_stdout,
+                                                    communication,
+                                                    port,
+                                                    encrypt_data,
+                                                    args_passing,
+                                                    framing,
+                                                    cipher,
+                                                    buffer_size)
 
     def open(self):
         self.registered_fun = []
+        self.callback_depth = 0
         self.communicator.open()
+
+        if self.multiplex:
+            self.waiters = {}
+            self.dispatcher = threading.Thread(target=self._dispatch,
+                                               daemon=True)
+            self.dispatcher.start()
+
         return NamespaceWrapper(self)
 
+    @property
+    def callback_depth(self):
+        return getattr(self.local, "callback_depth", 0)
+
+    @callback_depth.setter
+    def callback_depth(self, value):
+        self.local.callback_depth = value
+
     def _save_stdout(self):
         (self.stdout, self.stderr) = self.communicator.get_stdout()
 
+    def _send(self, message):
+        with self.send_lock:
+            self.communicator.send(message)
+
+    def _tag(self, fun, request_id):
+        # Tcl defers the commands marked as queued that arrive while it is
+        # waiting for the result of a callback
+        tag = "\x02" + str(request_id) + " "
+        if self.callback_depth == 0:
+            tag = "\x01" + tag
+
+        return tag + fun
+
+    def _request(self):
+        request_id = next(self.request_ids)
+        waiter = Queue()
+
+        with self.waiters_lock:
+            if self.waiters is None:
+                raise RuntimeError("The TCL interpreter is closed")
+
+            self.waiters[request_id] = waiter
+
+        return (request_id, waiter)
+
+    def _release(self, request_id):
+        with self.waiters_lock:
+            if self.waiters is not None:
+                self.waiters.pop(request_id, None)
+
+    def _dispatch(self):
+        # Routes the messages tagged with a request id to the thread
+        # waiting for them
+        while True:
+            try:
+                data = self.communicator.receive()
+            except Exception:
+                data = "exit 1"
+
+            waiter = None
+            if data.startswith("\x02"):
+                (request_id, data) = data[1:].split(" ", 1)
+                with self.waiters_lock:
+                    waiter = self.waiters.get(int(request_id))
+
+            if list_get(data, 0) == "exit":
+                with self.waiters_lock:
+                    waiters = self.waiters.values()
+                    self.waiters = None
+
+                for waiter in waiters:
+                    waiter.put(data)
+
+                return
+
+            if waiter is not None:
+                waiter.put(data)
+
     def _eval(self, fun):
-        self.communicator.send(fun)
+        if self.dispatcher is None:
+            self._send(fun)
+            return self._receive(fun)
+
+        (request_id, waiter) = self._request()
+        try:
+            self._send(self._tag(fun, request_id))
+            return self._receive(fun, waiter.get)
+        finally:
+            self._release(request_id)
+
+    def _receive(self, fun, receive=None):
+        if receive is None:
+            receive = self.communicator.receive
 
         while True:
-            data = self.communicator.receive()
+            data = receive()
             code = list_get(data, 0)
             args = list_range(data, 1, "end")
 
@@ -92,12 +204,15 @@ class Interpreter:
                 [fun_id, args] = args.split(" ", 1)
                 args = to_list(args)
                 retval = None
+                self.callback_depth += 1
                 try:
                     retval = self.registered_fun[int(fun_id)](self, *args)
                     retval = stringify(retval)
-                    self.communicator.send("return " + retval)
+                    self._send("return " + retval)
                 except Exception as err:
-                    self.communicator.send("error " + "\"" + str(err) + "\"")
+                    self._send("error " + "\"" + str(err) + "\"")
+                finally:
+                    self.callback_depth -= 1
 
             else:
                 raise RuntimeError("Unknown code " + code)
@@ -107,6 +222,104 @@ class Interpreter:
         self.command_list.append(fun_str)
         return self._eval(fun_str)
 
+    def eval_many(self, commands, return_exceptions=False):
+        funs = []
+        for command in commands:
+            if isinstance(command, str):
+                fun_str = command
+            else:
+                fun_str = (command[0] + " " + join(command[1:])).strip()
+
+            self.command_list.append(fun_str)
+            funs.append(fun_str)
+
+        return self._eval_many(funs, return_exceptions)
+
+    def _eval_many(self, funs, return_exceptions=False):
+        if self.dispatcher is not None:
+            return self._eval_many_multiplexed(funs, return_exceptions)
+
+        # Commands are written without waiting for the previous results.
+        # Keeping the unread bytes below PIPELINE_BYTES guarantees that
+        # a write never blocks while the Tcl side is blocked on writing
+        # a result back, so the two processes cannot deadlock.
+        results = []
+        in_flight = deque()
+        in_flight_bytes = 0
+        next_fun = 0
+
+        while len(results) < len(funs):
+            while next_fun < len(funs):
+                fun = funs[next_fun]
+                if self.callback_depth == 0:
+                    # Tcl defers the commands marked as queued that arrive
+                    # while it is waiting for the result of a callback
+                    fun = "\x01" + fun
+
+                size = self.communicator.frame_size(fun)
+                if in_flight and (len(in_flight) >= self.PIPELINE_WINDOW or
+                                  in_flight_bytes + size > self.PIPELINE_BYTES):
+                    break
+
+                self._send(fun)
+                in_flight.append(size)
+                in_flight_bytes += size
+                next_fun += 1
+
+            try:
+                results.append(self._receive(funs[len(results)]))
+            except RuntimeError as err:
+                if not self.communicator.is_open():
+                    raise
+
+                results.append(err)
+
+            in_flight_bytes -= in_flight.popleft()
+
+        return self._collect(results, return_exceptions)
+
+    def _eval_many_multiplexed(self, funs, return_exceptions=False):
+        # The dispatcher thread always drains the results, so all the
+        # commands can be written at once
+        requests = []
+        results = []
+
+        try:
+            for fun in funs:
+                (request_id, waiter) = self._request()
+                requests.append((request_id, waiter))
+                self._send(self._tag(fun, request_id))
+
+            for (fun, (_, waiter)) in zip(funs, requests):
+                try:
+                    results.append(self._receive(fun, waiter.get))
+                except RuntimeError as err:
+                    if not self.communicator.is_open():
+                        raise
+
+                    results.append(err)
+        finally:
+            for (request_id, _) in requests:
+                self._release(request_id)
+
+        return self._collect(results, return_exceptions)
+
+    def _collect(self, results, return_exceptions):
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def cipher_table(self, size=65536):
+        tcl = to_dict(self._eval("::private_pytcldriver_::cipher_benchmark " +
+                                 str(size)))
+        return _cipher_table(self.communicator, tcl, size)
+
     @property
     def version(self):
         return self._eval("info tcl_version")
@@ -159,6 +372,10 @@ class Interpreter:
     def close(self):
         self.communicator.close()
 
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+            self.dispatcher = None
+
     def __enter__(self):
         root = self.open()
         return self, root
@@ -166,6 +383,60 @@ class Interpreter:
     def __exit__(self, type, value, traceback):
         self.close()
 
+def _cipher_table(communicator, tcl, size):
+    python = communicator.cipher_benchmark(size)
+    table = {}
+
+    for (mode, info) in communicator.ciphers.items():
+        table[mode] = {"available": bool(int(info["available"])),
+                       "accelerated": bool(int(info["accelerated"])),
+                       "implementation": info["implementation"],
+                       "active": mode == communicator.cipher,
+                       "tcl_bytes_per_second": float(tcl[mode]),
+                       "python_bytes_per_second": python[mode]}
+
+    return table
+
+class Pipeline(object):
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.commands = []
+        self.results = None
+
+    def eval(self, fun, *args):
+        self.commands.append((fun,) + args)
+
+    def set(self, name, value=None):
+        if value is not None:
+            self.commands.append(("set", name, value))
+        else:
+            self.commands.append("set " + name)
+
+    def get(self, name):
+        self.set(name)
+
+    def unset(self, *names, nocomplain=False):
+        if nocomplain:
+            self.commands.append("unset -nocomplain -- " + join(names))
+        else:
+            self.commands.append("unset " + join(names))
+
+    def execute(self, return_exceptions=False):
+        commands = self.commands
+        self.commands = []
+        self.results = self.interpreter.eval_many(commands, return_exceptions)
+        return self.results
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.execute()
+
 class Namespace(dict):
     pass
 
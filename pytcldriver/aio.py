@@ -0,0 +1,452 @@
+# MIT License
+#
+# Copyright (c) 2024 Andrea Bellandi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import atexit
+import inspect
+from asyncio.subprocess import PIPE
+from collections import deque
+from contextlib import asynccontextmanager
+
+from . import Interpreter, Pipeline, Namespace, Array, Function, _cipher_table
+from .communicator import Communicator, POPEN_CLOSE_TIMEOUT
+from .wrappers import ReturnStringWrapper
+from .utils import join, stringify, list_get, list_range, to_list, to_dict
+
+STREAM_LIMIT=2**20
+
+class AsyncCommunicator(Communicator):
+    async def open(self):
+        atexit.register(self.terminate)
+        args = self.prepare()
+        loop = asyncio.get_running_loop()
+
+        if self.redirect_stdout:
+            self.process = await asyncio.create_subprocess_exec(*args,
+                                                                stderr=PIPE,
+                                                                stdout=PIPE,
+                                                                env=self.env)
+        else:
+            self.process = await asyncio.create_subprocess_exec(*args,
+                                                                env=self.env)
+
+        if self.communication == "socket":
+            self.socket.setblocking(False)
+            self.ctrl, self.address = await loop.sock_accept(self.socket)
+            self.configure_socket(self.ctrl)
+            (self.reader,
+             self.writer) = await asyncio.open_connection(sock=self.ctrl,
+                                                          limit=STREAM_LIMIT)
+
+        if self.communication == "pipe":
+            # Opening a FIFO blocks until the Tcl side opens the other end
+            self.pipe_p2t = await loop.run_in_executor(None, open,
+                                                       self.resources.pipe_p2t,
+                                                       "wb", 0)
+            self.pipe_t2p = await loop.run_in_executor(None, open,
+                                                       self.resources.pipe_t2p,
+                                                       "rb", 0)
+
+            self.reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+            await loop.connect_read_pipe(
+                    lambda: asyncio.StreamReaderProtocol(self.reader),
+                    self.pipe_t2p)
+
+            (transport, protocol) = await loop.connect_write_pipe(
+                    lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()),
+                    self.pipe_p2t)
+
+            self.writer = asyncio.StreamWriter(transport, protocol,
+                                               None, loop)
+
+        if self.encrypt_data:
+            (message, aes_key) = self.rekey_message()
+            await self.send(message)
+            self.aes_key = aes_key
+            self.iv_counter = 0
+            assert await self.receive() == "return 1"
+
+        await self.send(self.negotiation_message())
+        self.negotiated(await self.receive())
+        self.connected = True
+
+    async def send(self, message):
+        self.writer.write(self.frame(message))
+        await self.writer.drain()
+
+    async def receive_bytes(self, num):
+        return await self.reader.readexactly(num)
+
+    async def receive(self):
+        data_len = await self.receive_bytes(self.header_size())
+        data_len = self.frame_len(data_len)
+        data = await self.receive_bytes(data_len)
+        return self.unframe(data)
+
+    def check_alive(self):
+        return self.process.returncode
+
+    def terminate(self):
+        self.connected = False
+
+        try:
+            if self.check_alive() == None:
+                self.process.kill()
+        except:
+            pass
+
+        self.release()
+        atexit.unregister(self.terminate)
+
+    async def close(self):
+        self.connected = False
+
+        try:
+            await self.send("exit 0")
+        except:
+            pass
+
+        stdout = None
+        stderr = None
+
+        try:
+            (stdout, stderr) = await asyncio.wait_for(self.process.communicate(),
+                                                      POPEN_CLOSE_TIMEOUT)
+        except:
+            try:
+                self.process.kill()
+            except:
+                pass
+
+        try:
+            self.writer.close()
+        except:
+            pass
+
+        self.release()
+
+        self.stdout = ""
+        self.stderr = ""
+
+        if self.redirect_stdout:
+            try:
+                self.stdout = stdout.decode("utf-8")
+                self.stderr = stderr.decode("utf-8")
+            except:
+                pass
+
+        atexit.unregister(self.terminate)
+
+
+class AsyncInterpreter(Interpreter):
+    communicator_class=AsyncCommunicator
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncInterpreter, self).__init__(*args, **kwargs)
+        self.lock = asyncio.Lock()
+        self.lock_owner = None
+
+    async def open(self):
+        self.registered_fun = []
+        self.callback_depth = 0
+        await self.communicator.open()
+        return AsyncNamespaceWrapper(self)
+
+    @asynccontextmanager
+    async def _exclusive(self):
+        # Callbacks run inside the task that owns the communicator, so
+        # their nested evaluations must not wait for the lock again
+        task = asyncio.current_task()
+        if self.lock_owner is task:
+            yield
+            return
+
+        async with self.lock:
+            self.lock_owner = task
+            try:
+                yield
+            finally:
+                self.lock_owner = None
+
+    async def _eval(self, fun):
+        async with self._exclusive():
+            await self.communicator.send(fun)
+            return await self._receive(fun)
+
+    async def _receive(self, fun):
+        while True:
+            data = await self.communicator.receive()
+            code = list_get(data, 0)
+            args = list_range(data, 1, "end")
+
+            if code == "return":
+                return ReturnStringWrapper(args)
+
+            elif code == "exit":
+                await self.communicator.close()
+                raise RuntimeError("The TCL interpreter has closed while " \
+                                   "executing .eval(\"" + fun + "\")")
+
+            elif code == "error":
+                args = list_get(args, 0)
+                raise RuntimeError("While executing .eval(\"" + fun + "\"): " +
+                                   args)
+
+            elif code == "call":
+                [fun_id, args] = args.split(" ", 1)
+                args = to_list(args)
+                retval = None
+                self.callback_depth += 1
+                try:
+                    retval = self.registered_fun[int(fun_id)](self, *args)
+                    if inspect.isawaitable(retval):
+                        retval = await retval
+
+                    retval = stringify(retval)
+                    await self.communicator.send("return " + retval)
+                except Exception as err:
+                    await self.communicator.send("error " + "\"" + str(err) + "\"")
+                finally:
+                    self.callback_depth -= 1
+
+            else:
+                raise RuntimeError("Unknown code " + code)
+
+    async def _eval_many(self, funs, return_exceptions=False):
+        results = []
+        in_flight = deque()
+        in_flight_bytes = 0
+        next_fun = 0
+
+        async with self._exclusive():
+            while len(results) < len(funs):
+                while next_fun < len(funs):
+                    fun = funs[next_fun]
+                    if self.callback_depth == 0:
+                        fun = "\x01" + fun
+
+                    size = self.communicator.frame_size(fun)
+                    if in_flight and (len(in_flight) >= self.PIPELINE_WINDOW or
+                                      in_flight_bytes + size > self.PIPELINE_BYTES):
+                        break
+
+                    await self.communicator.send(fun)
+                    in_flight.append(size)
+                    in_flight_bytes += size
+                    next_fun += 1
+
+                try:
+                    results.append(await self._receive(funs[len(results)]))
+                except RuntimeError as err:
+                    if not self.communicator.is_open():
+                        raise
+
+                    results.append(err)
+
+                in_flight_bytes -= in_flight.popleft()
+
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
+        return results
+
+    def pipeline(self):
+        return AsyncPipeline(self)
+
+    async def cipher_table(self, size=65536):
+        tcl = to_dict(await self._eval("::private_pytcldriver_::cipher_benchmark " +
+                                       str(size)))
+        return _cipher_table(self.communicator, tcl, size)
+
+    async def puts(self, *values):
+        await self._eval("puts " + stringify(values))
+
+    async def cd(self, path=None):
+        if path:
+            await self.eval("cd " + stringify(path))
+        else:
+            await self.eval("cd")
+
+    async def source(self, filename):
+        await self.eval("source " + filename)
+
+    async def unset(self, *names, nocomplain=False):
+        if nocomplain:
+            await self.eval("unset -nocomplain -- " + join(names))
+        else:
+            await self.eval("unset " + join(names))
+
+    async def register_fun(self, name, fun):
+        idx = len(self.registered_fun)
+        self.registered_fun.append(fun)
+        await self.eval("::private_pytcldriver_::register_function " +
+                        name + " " +
+                        str(idx))
+
+    async def close(self):
+        await self.communicator.close()
+
+    async def __aenter__(self):
+        root = await self.open()
+        return self, root
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+
+class AsyncPipeline(Pipeline):
+    async def execute(self, return_exceptions=False):
+        commands = self.commands
+        self.commands = []
+        self.results = await self.interpreter.eval_many(commands,
+                                                        return_exceptions)
+        return self.results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        if type is None:
+            await self.execute()
+
+
+async def _kind(interpreter, address):
+    if await interpreter._eval("info commands " + address) == address:
+        return "proc"
+
+    elif int(await interpreter._eval("array exists " + stringify(address))):
+        return "array"
+
+    elif await interpreter._eval("info vars " + address) == address:
+        return "variable"
+
+    elif int(await interpreter._eval("namespace exists " + stringify(address))):
+        return "namespace"
+
+    else:
+        return None
+
+
+def _private(ns):
+    return (ns.__dict__["__private_interpreter"],
+            ns.__dict__["__private_address"])
+
+
+class AsyncNamespaceWrapper(object):
+    def __init__(self, interpreter, address = ""):
+        self.__dict__["__private_interpreter"] = interpreter
+        self.__dict__["__private_address"] = address
+
+    def __getitem__(self, name):
+        (interpreter, ns_address) = _private(self)
+        return AsyncNamespaceWrapper(interpreter,
+                                     ns_address + "::" + stringify(name))
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def __setattr__(self, name, value):
+        raise TypeError("Use 'await assign(ns, name, value)' to assign " +
+                        "Tcl symbols asynchronously")
+
+    def __call__(self, *args):
+        (interpreter, address) = _private(self)
+        return interpreter.eval(address, *args)
+
+    def __await__(self):
+        return self.__resolve().__await__()
+
+    async def __resolve(self):
+        (interpreter, address) = _private(self)
+        kind = await _kind(interpreter, address)
+
+        if kind == "variable":
+            return await interpreter._eval("set " + address)
+
+        elif kind == "array":
+            return to_dict(await interpreter._eval("array get " +
+                                                   stringify(address)))
+
+        elif kind in ["proc", "namespace"]:
+            return self
+
+        else:
+            raise NameError("name '{}' is not defined in Tcl".format(address))
+
+
+async def assign(ns, name, value):
+    (interpreter, ns_address) = _private(ns)
+    name = stringify(name)
+    address = ns_address + "::" + name
+
+    await remove(ns, name, nocomplain=True)
+
+    if isinstance(value, Namespace):
+        await interpreter.eval("namespace eval {} {{}}".format(address))
+        for key, val in value.items():
+            await assign(ns[name], key, val)
+
+    elif isinstance(value, Array):
+        await interpreter.eval("array set", address,
+                               [x for xs in value.items() for x in xs])
+
+    elif isinstance(value, Function):
+        await interpreter.register_fun(address, value)
+
+    elif callable(value):
+        await interpreter.register_fun(address, Function(value, True))
+
+    else:
+        await interpreter.set(address, value)
+
+
+async def remove(ns, name, nocomplain=False):
+    (interpreter, ns_address) = _private(ns)
+    address = ns_address + "::" + stringify(name)
+    kind = await _kind(interpreter, address)
+
+    if kind == "namespace":
+        await interpreter.eval("namespace delete " + stringify(address))
+
+    elif kind == "proc":
+        await interpreter.eval("rename", address, "\"\"")
+
+    elif kind in ["array", "variable"]:
+        await interpreter.unset(address)
+
+    elif not nocomplain:
+        raise NameError(("name '{}' is not defined " +
+                         "in Tcl namespace '{}'").format(name, ns_address))
+
+
+async def members(ns):
+    (interpreter, address) = _private(ns)
+    results = await interpreter.eval_many([
+                        "namespace children " + stringify(address or "::"),
+                        "info commands " + address + "::*",
+                        "info vars " + address + "::*"])
+
+    return [address.split("::")[-1]
+            for result in results
+            for address in to_list(result)]
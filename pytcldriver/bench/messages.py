@@ -0,0 +1,46 @@
+# MIT License
+#
+# Copyright (c) 2024 Andrea Bellandi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from pytcldriver import Interpreter
+from . import measure
+
+# Per-message cost of the encrypted transport on small messages
+def run(number=1000, communication="pipe"):
+    interp = Interpreter(communication=communication, encrypt_data=True)
+    interp.open()
+
+    def tcl_encrypt():
+        return float(interp._eval("lindex [time {::private_pytcldriver_::encrypt " +
+                                  "{return 1}} " + str(number) + "] 0")) * 1e-6
+
+    try:
+        interp.set("a", "1")
+        return {"round_trip": measure(lambda: interp.get("a"), number),
+                "python_encrypt": measure(lambda: interp.communicator.encrypt("set a"),
+                                          number),
+                "tcl_encrypt": min(tcl_encrypt() for _ in range(5))}
+    finally:
+        interp.close()
+
+if __name__ == "__main__":
+    for (name, value) in run().items():
+        print("{:<16} {:10.1f} us".format(name, value * 1e6))
@@ -0,0 +1,55 @@
+# MIT License
+#
+# Copyright (c) 2024 Andrea Bellandi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import time
+
+from pytcldriver import Interpreter
+
+SIZES=[2**10, 2**14, 2**17, 2**20, 2**23, 2**27 * 100 // 128]
+
+# Throughput of Tcl to Python transfers for growing payloads
+def run(sizes=SIZES, communication="socket", cipher="none", buffer_size=None):
+    interp = Interpreter(communication=communication,
+                         cipher=cipher,
+                         buffer_size=buffer_size)
+    interp.open()
+    result = {}
+
+    try:
+        for size in sizes:
+            interp._eval("set payload [string repeat x " + str(size) + "]")
+            start = time.perf_counter()
+            interp._eval("set payload")
+            elapsed = time.perf_counter() - start
+            result[size] = (elapsed, size / elapsed)
+
+        interp._eval("unset payload")
+    finally:
+        interp.close()
+
+    return result
+
+if __name__ == "__main__":
+    communication = sys.argv[1] if len(sys.argv) > 1 else "socket"
+    for (size, (elapsed, rate)) in run(communication=communication).items():
+        print("{:>10} B {:10.4f} s {:10.1f} MB/s".format(size, elapsed, rate / 1e6))
@@ -24,13 +24,22 @@ import socket
 from subprocess import Popen, PIPE
 from base64 import b64encode, b64decode
 from Crypto.Cipher import AES
+from Crypto.Hash import HMAC, SHA256
 from Crypto.Random import get_random_bytes
 import atexit
 import shlex
 from .tcl import ResourcesDirectory
+from .utils import to_list, to_dict
+import struct
+import time
 import os
 
-PACKET_SIZE=1024
+BUFFER_SIZE=65536
+HEADER_SIZE={"base64": 16, "binary": 4}
+FRAMINGS=["base64", "binary"]
+CIPHERS=["aes", "mac", "none"]
+MAC_SIZE=32
+BENCHMARK_TIME=0.05
 POPEN_CLOSE_TIMEOUT=5.0
 
 class Communicator(object):
@@ -39,24 +48,37 @@ class Communicator(object):
                  communication="auto",
                  port=None,
                  encrypt_data=True,
-                 args_passing="file"):
+                 args_passing="file",
+                 framing="auto",
+                 cipher=None,
+                 buffer_size=None):
 
         self.fragment = bytes()
+        self.buffer = bytearray()
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.ctrl = None
         self.process = None
         self.stdout = ""
         self.stderr = ""
         self.socket = None
         self.resources = None
         self.aes_key = None
+        self.iv_counter = 0
         self.pipe_p2t = None
         self.pipe_t2p = None
+        self.connected = False
+        self.framing = "base64"
+        self.cipher = "none"
+        self.ciphers = {}
 
         self.command = command
         self.env = env
         self.redirect_stdout = redirect_stdout
         self.port = port
-        self.encrypt_data = encrypt_data
         self.args_passing = args_passing
+        self.buffer_size = buffer_size
 
         if communication == "auto":
             if os.name == "posix":
@@ -66,13 +88,72 @@ class Communicator(object):
 
         self.communication = communication
 
+        if framing == "auto":
+            framing = "binary"
+
+        if framing not in FRAMINGS:
+            raise Exception("Unknown framing. " \
+                            "Choose either 'base64' or 'binary'")
+
+        self.requested_framing = framing
+
+        if cipher is None:
+            cipher = "aes" if encrypt_data else "none"
+        elif cipher == "auto":
+            # Only the owner can open the FIFOs, while any local process
+            # can connect to the socket
+            cipher = "none" if communication == "pipe" else "aes"
+
+        if cipher not in CIPHERS:
+            raise Exception("Unknown cipher. " \
+                            "Choose either 'aes', 'mac' or 'none'")
+
+        self.requested_cipher = cipher
+        self.encrypt_data = cipher != "none"
+
     def open(self):
         atexit.register(self.close)
+        args = self.prepare()
+
+        if self.redirect_stdout:
+            self.process = Popen(args,
+                                 stderr=PIPE,
+                                 stdout=PIPE,
+                                 env=self.env)
+        else:
+            self.process = Popen(args,
+                                 env=self.env)
+
+        if self.communication == "socket":
+            self.ctrl, self.address = self.socket.accept()
+            self.configure_socket(self.ctrl)
+
+        if self.communication == "pipe":
+            self.pipe_p2t = open(self.resources.pipe_p2t, "wb")
+            self.pipe_t2p = open(self.resources.pipe_t2p, "rb")
+
+        if self.encrypt_data:
+            (message, aes_key) = self.rekey_message()
+            self.send(message)
+            self.aes_key = aes_key
+            self.iv_counter = 0
+            assert self.receive() == "return 1"
+
+        self.send(self.negotiation_message())
+        self.negotiated(self.receive())
+        self.connected = True
+
+    def prepare(self):
         self.fragment = bytes()
+        self.reset_buffer()
+        self.framing = "base64"
+        self.cipher = "aes" if self.encrypt_data else "none"
         self.stdout = ""
         self.stderr = ""
         self.resources = ResourcesDirectory()
 
+        self.iv_counter = 0
+
         if self.encrypt_data:
             self.aes_key = get_random_bytes(16)
         else:
@@ -113,7 +194,6 @@ class Communicator(object):
 
         if self.encrypt_data:
             tcl_args += " " + self.aes_key.hex()
-            tcl_args += " " + get_random_bytes(8).hex()
 
         if self.args_passing == "shell":
             args = shlex.split(self.command.format(script=self.resources.main_shell_path,
@@ -130,83 +210,173 @@ class Communicator(object):
             raise Exception("Unknown argument passing style. " \
                             "Choose either 'file' or 'shell'")
 
-        if self.redirect_stdout:
-            self.process = Popen(args,
-                                 stderr=PIPE,
-                                 stdout=PIPE,
-                                 env=self.env)
+        return args
+
+    def configure_socket(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # Setting the kernel buffers disables their automatic tuning
+        if self.buffer_size is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.buffer_size)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+
+    def reset_buffer(self):
+        self.view.release()
+        self.buffer = bytearray(self.buffer_size or BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def rekey_message(self):
+        aes_key = get_random_bytes(16)
+        message = "::private_pytcldriver_::rekey " + aes_key.hex()
+
+        return (message, aes_key)
+
+    def negotiation_message(self):
+        return ("::private_pytcldriver_::negotiate " +
+                self.requested_framing + " " +
+                self.requested_cipher + " " +
+                str(self.buffer_size or BUFFER_SIZE))
+
+    def negotiated(self, reply):
+        # Tcl answers in the old framing and cipher and switches right after
+        (self.framing,
+         self.cipher,
+         ciphers) = to_list(reply.split(" ", 1)[1])
+
+        self.ciphers = {mode: to_dict(info)
+                        for (mode, info) in to_dict(ciphers).items()}
+
+    def header_size(self):
+        return HEADER_SIZE[self.framing]
+
+    def frame(self, message):
+        data = self.encrypt(message)
+
+        if self.framing == "base64":
+            data = b64encode(data)
+            data_len = "%16x" % len(data)
+            data_len = data_len.encode("utf-8")
         else:
-            self.process = Popen(args,
-                                 env=self.env)
+            data_len = struct.pack(">I", len(data))
 
-        if self.communication == "socket":
-            self.ctrl, self.address = self.socket.accept()
+        return data_len + data
 
-        if self.communication == "pipe":
-            self.pipe_p2t = open(self.resources.pipe_p2t, "wb")
-            self.pipe_t2p = open(self.resources.pipe_t2p, "rb")
+    def frame_len(self, header):
+        if self.framing == "base64":
+            return int(header.decode("utf-8"), 16)
+        else:
+            return struct.unpack(">I", header)[0]
 
-        if self.encrypt_data:
-            aes_key = get_random_bytes(16)
-            self.send("::private_pytcldriver_::rekey " +
-                      aes_key.hex() + " " +
-                      get_random_bytes(8).hex())
+    def unframe(self, data):
+        if self.framing == "base64":
+            data = b64decode(data)
 
-            self.aes_key = aes_key
-            assert self.receive() == "return 1"
+        return self.decrypt(data)
 
     def send(self, message):
-        data = self.encrypt(message)
-        data_len = len(data)
-        data_len = "%16x" % data_len
-        data_len = data_len.encode("utf-8")
-        data = data_len + data
+        data = self.frame(message)
 
         if self.communication == "socket":
-            self.ctrl.send(data)
+            self.ctrl.sendall(data)
 
         if self.communication == "pipe":
             self.pipe_p2t.write(data)
             self.pipe_p2t.flush()
 
+    def frame_size(self, message):
+        data_len = len(message.encode())
+
+        if self.cipher == "aes":
+            data_len += 16 - (data_len % 16) + 17
+        elif self.cipher == "mac":
+            data_len += MAC_SIZE
+
+        if self.framing == "base64":
+            data_len = 4 * ((data_len + 2) // 3)
+
+        return self.header_size() + data_len
+
     def receive_bytes(self, num):
         if self.communication == "socket":
-            while len(self.fragment) < num:
-                self.fragment += self.ctrl.recv(PACKET_SIZE)
+            return self.receive_socket_bytes(num)
 
         if self.communication == "pipe":
             self.fragment += self.pipe_t2p.read(num - len(self.fragment))
 
+        if len(self.fragment) < num:
+            raise RuntimeError("The connection with the TCL interpreter " \
+                               "has been closed")
+
         data = self.fragment[:num]
         self.fragment = self.fragment[num:]
         return data
 
+    def receive_socket_bytes(self, num):
+        available = self.end - self.start
+
+        if self.start + num > len(self.buffer):
+            # Moves the pending bytes to the front, growing the buffer
+            # only when the frame does not fit
+            if num > len(self.buffer):
+                buffer = bytearray(num)
+                buffer[:available] = self.view[self.start:self.end]
+                self.view.release()
+                self.buffer = buffer
+                self.view = memoryview(buffer)
+            else:
+                self.buffer[:available] = self.buffer[self.start:self.end]
+
+            self.start = 0
+            self.end = available
+
+        while self.end - self.start < num:
+            received = self.ctrl.recv_into(self.view[self.end:])
+            if not received:
+                raise RuntimeError("The connection with the TCL interpreter " \
+                                   "has been closed")
+
+            self.end += received
+
+        data = bytes(self.view[self.start:self.start + num])
+        self.start += num
+
+        if self.start == self.end:
+            if len(self.buffer) > (self.buffer_size or BUFFER_SIZE):
+                self.reset_buffer()
+            else:
+                self.start = 0
+                self.end = 0
+
+        return data
+
     def receive(self):
-        data_len = self.receive_bytes(16)
-        data_len = data_len.decode("utf-8")
-        data_len = int(data_len, 16)
+        data_len = self.receive_bytes(self.header_size())
+        data_len = self.frame_len(data_len)
         data = self.receive_bytes(data_len)
-        return self.decrypt(data)
+        return self.unframe(data)
 
     def encrypt(self, message):
         data = message.encode()
 
-        if self.encrypt_data:
-            iv = get_random_bytes(16)
+        if self.cipher == "aes":
+            # IVs never repeat under a key. Tcl uses the "t" direction.
+            self.iv_counter += 1
+            iv = b"p" + bytes(7) + struct.pack(">Q", self.iv_counter)
             cipher = AES.new(self.aes_key, AES.MODE_CBC, iv)
             pad = 16 - (len(data) % 16)
-            pad_ext = get_random_bytes(pad)
-            pad_ext = bytes([48 + b % 64 for b in pad_ext])
-            data += pad_ext
-            data = pad.to_bytes(1, "big") + cipher.iv + cipher.encrypt(data)
+            data += b"0" * pad
+            data = pad.to_bytes(1, "big") + iv + cipher.encrypt(data)
+
+        elif self.cipher == "mac":
+            data += HMAC.new(self.aes_key, b"p" + data,
+                             digestmod=SHA256).digest()
 
-        data = b64encode(data)
         return data
 
     def decrypt(self, data):
-        data = b64decode(data)
-
-        if self.encrypt_data:
+        if self.cipher == "aes":
             pad = data[0]
             iv = data[1:17]
             data = data[17:]
@@ -216,13 +386,53 @@ class Communicator(object):
             if pad > 0:
                 data = data[:-pad]
 
+        elif self.cipher == "mac":
+            tag = data[-MAC_SIZE:]
+            data = data[:-MAC_SIZE]
+            try:
+                HMAC.new(self.aes_key, b"t" + data,
+                         digestmod=SHA256).verify(tag)
+            except ValueError:
+                raise RuntimeError("Message authentication failed")
+
         data = data.decode("utf-8")
         return data
 
+    def cipher_benchmark(self, size):
+        saved = (self.cipher, self.aes_key)
+        if self.aes_key is None:
+            self.aes_key = get_random_bytes(16)
+
+        message = "x" * size
+        result = {}
+
+        try:
+            for mode in CIPHERS:
+                self.cipher = mode
+                count = 0
+                start = time.perf_counter()
+                elapsed = 0
+
+                while elapsed < BENCHMARK_TIME:
+                    self.encrypt(message)
+                    count += 1
+                    elapsed = time.perf_counter() - start
+
+                result[mode] = size * count / elapsed
+        finally:
+            (self.cipher, self.aes_key) = saved
+
+        return result
+
     def check_alive(self):
         return self.process.poll()
 
+    def is_open(self):
+        return self.connected
+
     def close(self):
+        self.connected = False
+
         try:
             self.send("exit 0")
         except:
@@ -235,7 +445,27 @@ class Communicator(object):
         except:
             pass
 
+        self.release()
+
+        self.stdout = ""
+        self.stderr = ""
+
+        if self.redirect_stdout:
+            try:
+                    self.stdout = self.process.stdout.read().decode("utf-8")
+                    self.stderr = self.process.stderr.read().decode("utf-8")
+            except:
+                pass
+
+        atexit.unregister(self.close)
+
+    def release(self):
         if self.communication == "socket":
+            try:
+                self.ctrl.close()
+            except:
+                pass
+
             try:
                 self.socket.close()
             except:
@@ -254,15 +484,3 @@ class Communicator(object):
                 os.remove(self.resources.pipe_t2p)
             except:
                 pass
-
-        self.stdout = ""
-        self.stderr = ""
-
-        if self.redirect_stdout:
-            try:
-                    self.stdout = self.process.stdout.read().decode("utf-8")
-                    self.stderr = self.process.stderr.read().decode("utf-8")
-            except:
-                pass
-
-        atexit.unregister(self.close)
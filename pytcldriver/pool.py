@@ -0,0 +1,273 @@
+# MIT License
+#
+# Copyright (c) 2024 Andrea Bellandi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from . import Interpreter
+from .wrappers import NamespaceWrapper
+from .utils import stringify, to_list
+
+REFILL_RETRY_DELAY=1.0
+
+def save_state(interp):
+    (variables,
+     commands,
+     namespaces,
+     pwd) = interp.eval_many(["info vars ::*",
+                              "info commands ::*",
+                              "namespace children ::",
+                              "pwd"])
+
+    return {"variables": set(to_list(variables)),
+            "commands": set(to_list(commands)),
+            "namespaces": set(to_list(namespaces)),
+            "pwd": str(pwd)}
+
+def restore_state(interp, baseline):
+    state = save_state(interp)
+    commands = []
+
+    for name in state["variables"] - baseline["variables"]:
+        commands.append("unset -nocomplain -- " + stringify(name))
+
+    for name in state["commands"] - baseline["commands"]:
+        commands.append("rename " + stringify(name) + " {}")
+
+    for name in state["namespaces"] - baseline["namespaces"]:
+        commands.append("namespace delete " + stringify(name))
+
+    if state["pwd"] != baseline["pwd"]:
+        commands.append("cd " + stringify(baseline["pwd"]))
+
+    interp.eval_many(commands)
+    interp.registered_fun = []
+    interp.command_list = []
+
+
+class _Entry(object):
+    def __init__(self, interpreter, baseline):
+        self.interpreter = interpreter
+        self.baseline = baseline
+        self.created = time.monotonic()
+        self.uses = 0
+
+
+class InterpreterPool(object):
+    def __init__(self,
+                 factory=Interpreter,
+                 size=1,
+                 max_size=None,
+                 max_uses=None,
+                 max_lifetime=None,
+                 reset=restore_state,
+                 workers=1):
+
+        self.factory = factory
+        self.size = size
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.max_lifetime = max_lifetime
+        self.reset = reset
+
+        self.idle = deque()
+        self.busy = {}
+        self.retired = []
+        self.starting = 0
+        self.error = None
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.workers = [threading.Thread(target=self._maintain, daemon=True)
+                        for _ in range(workers)]
+
+        for worker in self.workers:
+            worker.start()
+
+    def _total(self):
+        return len(self.idle) + len(self.busy) + self.starting
+
+    def _needs_refill(self):
+        if self.closed:
+            return False
+
+        if self.max_size is not None and self._total() >= self.max_size:
+            return False
+
+        return len(self.idle) + self.starting < self.size
+
+    def _expired(self, entry):
+        if self.max_uses is not None and entry.uses >= self.max_uses:
+            return True
+
+        if (self.max_lifetime is not None and
+            time.monotonic() - entry.created >= self.max_lifetime):
+            return True
+
+        return entry.interpreter.communicator.check_alive() is not None
+
+    def _create(self):
+        interp = self.factory()
+        interp.open()
+
+        try:
+            return _Entry(interp, save_state(interp))
+        except:
+            interp.close()
+            raise
+
+    def _maintain(self):
+        while True:
+            with self.condition:
+                while not (self.closed or self.retired or self._needs_refill()):
+                    self.condition.wait()
+
+                retired = self.retired
+                self.retired = []
+                refill = self._needs_refill()
+
+                if self.closed and not retired:
+                    return
+
+                if refill:
+                    self.starting += 1
+
+            for entry in retired:
+                try:
+                    entry.interpreter.close()
+                except:
+                    pass
+
+            if refill:
+                try:
+                    entry = self._create()
+                except Exception as err:
+                    with self.condition:
+                        self.starting -= 1
+                        self.error = err
+                        self.condition.notify_all()
+
+                    time.sleep(REFILL_RETRY_DELAY)
+                    continue
+
+                with self.condition:
+                    self.starting -= 1
+                    self.error = None
+
+                    if self.closed:
+                        self.retired.append(entry)
+                    else:
+                        self.idle.append(entry)
+
+                    self.condition.notify_all()
+
+    def checkout(self, timeout=None):
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError("The interpreter pool is closed")
+
+                while self.idle:
+                    entry = self.idle.popleft()
+                    if self._expired(entry):
+                        self.retired.append(entry)
+                        continue
+
+                    self.busy[id(entry.interpreter)] = entry
+                    self.condition.notify_all()
+                    return entry.interpreter
+
+                if self.error is not None and self.starting == 0:
+                    raise RuntimeError("Cannot start a pooled interpreter: " +
+                                       str(self.error))
+
+                self.condition.notify_all()
+
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.condition.wait(remaining):
+                        raise TimeoutError("No pooled interpreter available")
+
+    def checkin(self, interp):
+        with self.condition:
+            entry = self.busy.pop(id(interp))
+
+        entry.uses += 1
+        keep = not (self.closed or self._expired(entry))
+
+        if keep and self.reset:
+            try:
+                self.reset(interp, entry.baseline)
+            except Exception:
+                keep = False
+
+        with self.condition:
+            closed = self.closed
+            if keep and not closed:
+                self.idle.append(entry)
+            elif not closed:
+                self.retired.append(entry)
+
+            self.condition.notify_all()
+
+        if closed:
+            interp.close()
+
+    @contextmanager
+    def interpreter(self, timeout=None):
+        interp = self.checkout(timeout)
+        try:
+            yield interp, NamespaceWrapper(interp)
+        finally:
+            self.checkin(interp)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.retired.extend(self.idle)
+            self.idle.clear()
+            self.condition.notify_all()
+
+        for worker in self.workers:
+            worker.join()
+
+        for entry in self.retired:
+            try:
+                entry.interpreter.close()
+            except:
+                pass
+
+        self.retired = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
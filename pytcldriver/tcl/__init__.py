@@ -41,7 +41,7 @@ class ResourcesDirectory(object):
         resource_path = files("pytcldriver.tcl")
 
         for name in ["main_shell.tcl", "main_file.tcl", "communicator.tcl",
-                     "dict.tcl", "mt19937.tcl"]:
+                     "dict.tcl", "sha256.tcl"]:
 
             with open(os.path.join(tcl_sources_directory, name), "w") as f:
                 f.write(resource_path.joinpath(name).read_text())
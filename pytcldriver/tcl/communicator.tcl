@@ -25,15 +25,26 @@ namespace eval ::private_pytcldriver_ {
   variable fp_p2t ""
   variable fp_t2p ""
   variable aes_key ""
-  variable prng ""
-  variable recv_data ""
+  variable iv_counter 0
+  variable aes_context ""
+  variable aes_context_key ""
+  variable read_chunk 65536
   variable comm_stack 0
+  variable deferred {}
+  variable tags {}
+  variable framing "base64"
+  variable cipher "none"
+  variable mac_impl "tcl"
+  variable after_send {}
   variable script_dir [file dirname $::argv0]
-  source [file join $script_dir mt19937.tcl]
+  source [file join $script_dir sha256.tcl]
 }
 
 source [file join $script_dir dict.tcl]
 
+# The tcllib packages use their C implementations when tcllibc is present
+catch {package require tcllibc}
+
 if {[catch {package require base64} err]} {
   set dir [file join $::private_pytcldriver_::script_dir base64]
   source [file join $dir pkgIndex.tcl]
@@ -48,44 +59,56 @@ if {[catch {package require aes} err]} {
   unset dir
 }
 
+# A host sha256 package is used for the MAC only if it agrees with ours
+if {![catch {package require sha256} err] &&
+    ![catch {::sha2::hmac -key key -- message} err] &&
+    [string equal $err [::private_pytcldriver_::sha256::hmac key message]]} {
+  set ::private_pytcldriver_::mac_impl "sha256"
+}
+
 proc ::private_pytcldriver_::init {params} {
   variable port [lindex $params 0]
   if {[llength $params] > 1} {
      variable aes_key [binary format H* [lindex $params 1]]
-     mt::seed "0x[lindex $params 2]"
+     variable cipher "aes"
   }
 }
 
-proc ::private_pytcldriver_::rekey {new_key new_seed} {
+proc ::private_pytcldriver_::rekey {new_key} {
   variable aes_key [binary format H* $new_key]
-  mt::seed "0x$new_seed"
+  variable iv_counter 0
+  variable aes_context ""
+  variable aes_context_key ""
   return 1
 }
 
 proc ::private_pytcldriver_::new_iv {} {
-  set result ""
-  append result [binary format I [mt::int32]]
-  append result [binary format I [mt::int32]]
-  append result [binary format I [mt::int32]]
-  append result [binary format I [mt::int32]]
-  return $result
-}
+  variable iv_counter
 
-proc ::private_pytcldriver_::pad_extend {pad} {
-  set ext ""
-  set N [expr $pad / 4]
+  # IVs never repeat under a key. Python uses the "p" direction.
+  incr iv_counter
+  return [binary format a1x7II "t" [expr {$iv_counter >> 32}] \
+                                  [expr {$iv_counter & 0xffffffff}]]
+}
 
-  for {set i 0} {$i < $N} {incr i} {
-    append ext [binary format I [mt::int32]]
-  }
+proc ::private_pytcldriver_::aes_context {iv} {
+  variable aes_key
+  variable aes_context
+  variable aes_context_key
 
-  set N [expr $pad % 4]
+  # The key schedule is computed once per key
+  if {[string equal $aes_context_key $aes_key]} {
+    ::aes::Reset $aes_context $iv
+  } else {
+    if {$aes_context != ""} {
+      ::aes::Final $aes_context
+    }
 
-  for {set i 0} {$i < $N } {incr i} {
-    append ext [binary format c [expr [mt::int32] % 0xff]]
+    set aes_context [::aes::Init cbc $aes_key $iv]
+    set aes_context_key $aes_key
   }
 
-  return $ext
+  return $aes_context
 }
 
 proc ::private_pytcldriver_::open_connection {} {
@@ -97,6 +120,8 @@ proc ::private_pytcldriver_::open_connection {} {
   if {$port == "pipe"} {
     set fp_p2t [open [file join $script_dir pipe_p2t] "r"]
     set fp_t2p [open [file join $script_dir pipe_t2p] "w"]
+    fconfigure $fp_p2t -translation binary
+    fconfigure $fp_t2p -translation binary
   } else {
     set sock [socket localhost $port]
     fconfigure $sock -translation binary
@@ -105,71 +130,197 @@ proc ::private_pytcldriver_::open_connection {} {
   }
 }
 
+proc ::private_pytcldriver_::ciphers {} {
+  set aes_impl "tcl"
+  if {[package provide tcllibc] != ""} {
+    set aes_impl "tcllibc"
+  }
+
+  variable mac_impl
+  set mac_accelerated 0
+  foreach impl {critcl cryptkit trf} {
+    if {($mac_impl == "sha256") && [info exists ::sha2::accel($impl)] &&
+        $::sha2::accel($impl)} {
+      set mac_accelerated 1
+    }
+  }
+
+  return [list \
+    aes [list available 1 accelerated [expr {$aes_impl != "tcl"}] \
+              implementation $aes_impl] \
+    mac [list available 1 accelerated $mac_accelerated \
+              implementation $mac_impl] \
+    none [list available 1 accelerated 1 implementation none]]
+}
+
+proc ::private_pytcldriver_::cipher_benchmark {size} {
+  variable cipher
+  variable aes_key
+
+  set saved [list $cipher $aes_key]
+  if {$aes_key == ""} {
+    set aes_key [string repeat k 16]
+  }
+
+  set data [string repeat x $size]
+  set result {}
+
+  foreach mode {aes mac none} {
+    set cipher $mode
+    set usec [lindex [time {encrypt $data}] 0]
+    if {$usec < 1} {
+      set usec 1
+    }
+
+    lappend result $mode [expr {1e6 * $size / $usec}]
+  }
+
+  foreach {cipher aes_key} $saved {}
+  return $result
+}
+
+proc ::private_pytcldriver_::negotiate {mode {requested ""} {buffersize ""}} {
+  variable after_send
+  variable aes_key
+  variable cipher
+  variable fp_p2t
+  variable fp_t2p
+
+  if {$buffersize != ""} {
+    fconfigure $fp_p2t -buffering full -buffersize $buffersize
+    fconfigure $fp_t2p -buffering full -buffersize $buffersize
+  }
+
+  if {($mode != "base64") && ($mode != "binary")} {
+    set mode "base64"
+  }
+
+  # Without a shared key only the plain mode can be used
+  set chosen $cipher
+  if {($requested == "none") ||
+      ((($requested == "aes") || ($requested == "mac")) && ($aes_key != ""))} {
+    set chosen $requested
+  }
+
+  # The reply still uses the current framing and cipher
+  lappend after_send framing $mode cipher $chosen
+  return [list $mode $chosen [ciphers]]
+}
+
 proc ::private_pytcldriver_::send {data} {
   variable fp_t2p
+  variable tags
+  variable framing
+  variable after_send
+
+  # Messages sent while executing a multiplexed request carry its id
+  if {[llength $tags] > 0} {
+    set data "[lindex $tags end]$data"
+  }
+
   set data [encrypt $data]
-  set data_len [string bytelength $data]
-  set data_len [format %16x $data_len]
-  set data_len [encoding convertto utf-8 $data_len]
+
+  if {$framing == "base64"} {
+    set data [::base64::encode -wrapchar "" $data]
+    set data_len [format %16x [string length $data]]
+  } else {
+    set data_len [binary format I [string length $data]]
+  }
+
   puts -nonewline $fp_t2p $data_len
   puts -nonewline $fp_t2p $data
   flush $fp_t2p
+
+  foreach {name value} $after_send {
+    variable $name $value
+  }
+
+  set after_send {}
 }
 
 proc ::private_pytcldriver_::receive_bytes {num} {
   variable fp_p2t
-  variable recv_data
+  variable read_chunk
 
-  while {$num > [string bytelength $recv_data]} {
-    set diff [expr $num - [string bytelength $recv_data]]
-    set received [read $fp_p2t $diff]
-    append recv_data $received
-  }
+  # A blocking read returns the requested bytes unless the channel is
+  # closed, so nothing is read past the frame
+  set result ""
+  while {$num > 0} {
+    if {$num < $read_chunk} {
+      set received [read $fp_p2t $num]
+    } else {
+      set received [read $fp_p2t $read_chunk]
+    }
 
-  set format_string a$num
-  append format_string a*
-  binary scan $recv_data $format_string result recv_data
+    if {[string length $received] == 0 && [eof $fp_p2t]} {
+      exit_ 1
+    }
+
+    append result $received
+    set num [expr {$num - [string length $received]}]
+  }
 
   return $result
 }
 
 proc ::private_pytcldriver_::receive {} {
-  set data_len [receive_bytes 16]
-  set data_len [encoding convertfrom utf-8 $data_len]
-  set data_len [scan $data_len %x]
-  set data [receive_bytes $data_len]
+  variable framing
+
+  if {$framing == "base64"} {
+    set data_len [scan [receive_bytes 16] %x]
+    set data [::base64::decode [receive_bytes $data_len]]
+  } else {
+    binary scan [receive_bytes 4] I data_len
+    set data [receive_bytes [expr {$data_len & 0xffffffff}]]
+  }
+
   return [decrypt $data]
 }
 
+proc ::private_pytcldriver_::mac {data} {
+  variable aes_key
+  variable mac_impl
+
+  if {$mac_impl == "sha256"} {
+    return [::sha2::hmac -key $aes_key -- $data]
+  }
+
+  return [sha256::hmac $aes_key $data]
+}
+
 proc ::private_pytcldriver_::encrypt {data} {
   variable aes_key
+  variable cipher
 
   set data [encoding convertto utf-8 $data]
 
-  if {$aes_key != ""} {
+  if {$cipher == "aes"} {
     set iv [new_iv]
-    set pad [expr 16 - ([string bytelength $data] % 16)]
-    append data [pad_extend $pad]
-    set pad [binary format c $pad]
-    set data [::aes::aes -mode cbc -dir encrypt -key $aes_key -iv $iv -- $data]
-    set data "$pad$iv$data"
+    set pad [expr 16 - ([string length $data] % 16)]
+    append data [string repeat 0 $pad]
+    set data [::aes::Encrypt [aes_context $iv] $data]
+    set data "[binary format c $pad]$iv$data"
+  } elseif {$cipher == "mac"} {
+    append data [mac "t$data"]
   }
 
-  set data [::base64::encode -wrapchar "" $data]
-
   return $data
 }
 
 proc ::private_pytcldriver_::decrypt {data} {
   variable aes_key
+  variable cipher
 
-  set data [::base64::decode $data]
-
-  if {$aes_key != ""} {
+  if {$cipher == "aes"} {
     binary scan $data ca16a* pad iv data
-    set data [::aes::aes -mode cbc -dir decrypt -key $aes_key -iv $iv -- $data]
-    set format_string "a[expr [string bytelength $data] - $pad]a$pad"
+    set data [::aes::Decrypt [aes_context $iv] $data]
+    set format_string "a[expr [string length $data] - $pad]a$pad"
     binary scan $data $format_string data pad
+  } elseif {$cipher == "mac"} {
+    binary scan $data a[expr {[string length $data] - 32}]a32 data tag
+    if {![string equal [mac "p$data"] $tag]} {
+      error "Message authentication failed"
+    }
   }
 
   set data [encoding convertfrom utf-8 $data]
@@ -207,21 +358,62 @@ proc ::exit {{retval 0}} {
   ::private_pytcldriver_::exit_ $retval
 }
 
+proc ::private_pytcldriver_::next_command {} {
+  variable comm_stack
+  variable deferred
+
+  # Commands pipelined by python start with \001 and are executed only by
+  # the outermost loop. The ones received while waiting for a callback
+  # result are deferred until the callback returns.
+  if {($comm_stack == 1) && ([llength $deferred] > 0)} {
+    set data [lindex $deferred 0]
+    set deferred [lrange $deferred 1 end]
+    return $data
+  }
+
+  while {1} {
+    set data [receive]
+    if {[string index $data 0] != "\001"} {
+      return $data
+    } elseif {$comm_stack == 1} {
+      return [string range $data 1 end]
+    }
+
+    lappend deferred [string range $data 1 end]
+  }
+}
+
 proc ::private_pytcldriver_::communicate {} {
   variable comm_stack
+  variable tags
   incr comm_stack 1
 
   while {1} {
-    set data [receive]
+    set data [next_command]
+    set tag ""
+
+    # Multiplexed requests start with \002 followed by their id
+    if {[string index $data 0] == "\002"} {
+      set idx [string first " " $data]
+      set tag [string range $data 0 $idx]
+      set data [string range $data [expr {$idx + 1}] end]
+    }
+
     set cmd [lindex $data 0]
-    if {($cmd == "error") || ($cmd == "return")} {
+    if {($comm_stack > 1) && (($cmd == "error") || ($cmd == "return"))} {
       incr comm_stack -1
       uplevel $data
-    } elseif {[catch {set result [uplevel $data]} err]} {
+    }
+
+    lappend tags $tag
+
+    if {[catch {set result [uplevel $data]} err]} {
       send "error \{$err\}"
     } else {
       send "return $result"
     }
+
+    set tags [lrange $tags 0 end-1]
   }
 }
 
@@ -0,0 +1,141 @@
+# MIT License
+#
+# Copyright (c) 2024 Andrea Bellandi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Pure Tcl SHA-256 and HMAC-SHA-256, used when the host Tcl does not
+# provide the tcllib sha256 package
+
+namespace eval sha256 {
+  variable K {
+    0x428a2f98 0x71374491 0xb5c0fbcf 0xe9b5dba5 0x3956c25b 0x59f111f1
+    0x923f82a4 0xab1c5ed5 0xd807aa98 0x12835b01 0x243185be 0x550c7dc3
+    0x72be5d74 0x80deb1fe 0x9bdc06a7 0xc19bf174 0xe49b69c1 0xefbe4786
+    0x0fc19dc6 0x240ca1cc 0x2de92c6f 0x4a7484aa 0x5cb0a9dc 0x76f988da
+    0x983e5152 0xa831c66d 0xb00327c8 0xbf597fc7 0xc6e00bf3 0xd5a79147
+    0x06ca6351 0x14292967 0x27b70a85 0x2e1b2138 0x4d2c6dfc 0x53380d13
+    0x650a7354 0x766a0abb 0x81c2c92e 0x92722c85 0xa2bfe8a1 0xa81a664b
+    0xc24b8b70 0xc76c51a3 0xd192e819 0xd6990624 0xf40e3585 0x106aa070
+    0x19a4c116 0x1e376c08 0x2748774c 0x34b0bcb5 0x391c0cb3 0x4ed8aa4a
+    0x5b9cca4f 0x682e6ff3 0x748f82ee 0x78a5636f 0x84c87814 0x8cc70208
+    0x90befffa 0xa4506ceb 0xbef9a3f7 0xc67178f2
+  }
+}
+
+proc sha256::digest {data} {
+  variable K
+
+  set len [string length $data]
+  append data \x80
+  append data [string repeat \x00 [expr {(55 - $len) % 64}]]
+  append data [binary format II [expr {($len >> 29) & 0xffffffff}] \
+                                [expr {($len << 3) & 0xffffffff}]]
+
+  set h0 0x6a09e667
+  set h1 0xbb67ae85
+  set h2 0x3c6ef372
+  set h3 0xa54ff53a
+  set h4 0x510e527f
+  set h5 0x9b05688c
+  set h6 0x1f83d9ab
+  set h7 0x5be0cd19
+
+  binary scan $data I* words
+  set num [llength $words]
+
+  for {set block 0} {$block < $num} {incr block 16} {
+    set W {}
+    foreach w [lrange $words $block [expr {$block + 15}]] {
+      lappend W [expr {$w & 0xffffffff}]
+    }
+
+    for {set t 16} {$t < 64} {incr t} {
+      set w2 [lindex $W [expr {$t - 2}]]
+      set w15 [lindex $W [expr {$t - 15}]]
+      lappend W [expr {((((($w2 >> 17) | ($w2 << 15)) ^
+                          (($w2 >> 19) | ($w2 << 13)) ^
+                          ($w2 >> 10)) & 0xffffffff) +
+                        [lindex $W [expr {$t - 7}]] +
+                        (((($w15 >> 7) | ($w15 << 25)) ^
+                          (($w15 >> 18) | ($w15 << 14)) ^
+                          ($w15 >> 3)) & 0xffffffff) +
+                        [lindex $W [expr {$t - 16}]]) & 0xffffffff}]
+    }
+
+    set a $h0
+    set b $h1
+    set c $h2
+    set d $h3
+    set e $h4
+    set f $h5
+    set g $h6
+    set h $h7
+
+    foreach k $K w $W {
+      set t1 [expr {($h +
+                     (((($e >> 6) | ($e << 26)) ^
+                       (($e >> 11) | ($e << 21)) ^
+                       (($e >> 25) | ($e << 7))) & 0xffffffff) +
+                     (($e & $f) ^ (~$e & $g)) + $k + $w) & 0xffffffff}]
+      set t2 [expr {(((($a >> 2) | ($a << 30)) ^
+                      (($a >> 13) | ($a << 19)) ^
+                      (($a >> 22) | ($a << 10))) & 0xffffffff) +
+                    (($a & $b) ^ ($a & $c) ^ ($b & $c))}]
+      set h $g
+      set g $f
+      set f $e
+      set e [expr {($d + $t1) & 0xffffffff}]
+      set d $c
+      set c $b
+      set b $a
+      set a [expr {($t1 + $t2) & 0xffffffff}]
+    }
+
+    set h0 [expr {($h0 + $a) & 0xffffffff}]
+    set h1 [expr {($h1 + $b) & 0xffffffff}]
+    set h2 [expr {($h2 + $c) & 0xffffffff}]
+    set h3 [expr {($h3 + $d) & 0xffffffff}]
+    set h4 [expr {($h4 + $e) & 0xffffffff}]
+    set h5 [expr {($h5 + $f) & 0xffffffff}]
+    set h6 [expr {($h6 + $g) & 0xffffffff}]
+    set h7 [expr {($h7 + $h) & 0xffffffff}]
+  }
+
+  return [binary format IIIIIIII $h0 $h1 $h2 $h3 $h4 $h5 $h6 $h7]
+}
+
+proc sha256::hmac {key data} {
+  if {[string length $key] > 64} {
+    set key [digest $key]
+  }
+
+  append key [string repeat \x00 [expr {64 - [string length $key]}]]
+  binary scan $key c* bytes
+
+  set ipad ""
+  set opad ""
+  foreach byte $bytes {
+    append ipad [binary format c [expr {$byte ^ 0x36}]]
+    append opad [binary format c [expr {$byte ^ 0x5c}]]
+  }
+
+  return [digest "$opad[digest $ipad$data]"]
+}
@@ -20,13 +20,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import threading
 import tkinter
 from tkinter import _magic_re, _space_re
 from importlib_resources import files
 
-# For older versions of TCL
-TKINTER = tkinter.Tcl()
-TKINTER.eval(files("pytcldriver.tcl").joinpath("dict.tcl").read_text())
+# A Tcl interpreter can be used only by the thread that created it
+class _ThreadTcl(threading.local):
+    def __init__(self):
+        self.interp = tkinter.Tcl()
+        # For older versions of TCL
+        self.interp.eval(files("pytcldriver.tcl").joinpath("dict.tcl").read_text())
+
+    def eval(self, script):
+        return self.interp.eval(script)
+
+    def call(self, *args):
+        return self.interp.call(*args)
+
+TKINTER = _ThreadTcl()
 
 # Needed modified join and stringify from tkinter
 ##########################################################
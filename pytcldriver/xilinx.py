@@ -21,6 +21,7 @@
 # SOFTWARE.
 
 from . import Interpreter
+from .aio import AsyncInterpreter
 import subprocess
 import shutil
 import shlex
@@ -86,3 +87,19 @@ class PlanAhead(Xilinx):
             return Path(shutil.which("ise")).parents[3]
 
 
+
+
+class AsyncVivado(Vivado, AsyncInterpreter):
+    pass
+
+
+class AsyncVitis(Vitis, AsyncInterpreter):
+    pass
+
+
+class AsyncISE(ISE, AsyncInterpreter):
+    pass
+
+
+class AsyncPlanAhead(PlanAhead, AsyncInterpreter):
+    pass